@@ -1,8 +1,6 @@
 
 import os 
 
-API_KEY = os.getenv("N2YO_API_KEY") 
-
 # Satellite NORAD IDs for Maxar Legion satellites
 SATELLITE_IDS = [ 59625, 60453, 59626, 60452, 40115  ]
 
@@ -20,8 +18,12 @@ CENTER_LAT = 55.0
 CENTER_LON = 30.0
 MAP_EXTENT = [-25, 45, 30, 75]  # [West, East, South, North]
 
-# TLE Source URL: N2YO API for satellite TLE
-TLE_URL = "https://api.n2yo.com/rest/v1/satellite/tle/{sat_id}&apiKey={api_key}"
+# TLE Source URL: Celestrak GP query for satellite TLE (no API key needed)
+TLE_URL = "https://celestrak.org/NORAD/elements/gp.php?CATNR={sat_id}&FORMAT=TLE"
+
+# Local TLE cache, reused while younger than the TTL
+TLE_CACHE_DIR = os.path.expanduser("~/.cache/satspy")
+TLE_CACHE_TTL_SECONDS = 6 * 60 * 60  # 6 hours
 
 # Output Images
 OUTPUT_IMAGE_FILTERED = "satellite_orbits_filtered.png"
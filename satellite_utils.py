@@ -0,0 +1,286 @@
+"""
+Helpers shared by the satellite plotting scripts: TLE download and caching,
+SGP4 propagation to geodetic coordinates and the cached base map features.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from sgp4.api import SGP4_ERRORS, SatrecArray
+from skyfield.api import load
+from skyfield.constants import DAY_S
+from skyfield.framelib import itrs
+from skyfield.functions import mxm, mxv
+from skyfield.sgp4lib import TEME
+import cartopy.feature as cfeature
+import matplotlib
+from matplotlib.backends import BackendFilter, backend_registry
+import functools
+import json
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from config import SATELLITE_IDS, TLE_URL, TLE_CACHE_DIR, TLE_CACHE_TTL_SECONDS
+
+# Shared HTTP session so parallel TLE fetches reuse pooled connections
+_POOL_SIZE = max(1, len(SATELLITE_IDS))  # Pools need at least one slot
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=_POOL_SIZE,
+                                       pool_maxsize=_POOL_SIZE))
+
+
+# ------------------------------ Helper Functions ------------------------------
+
+def fetch_tle(sat_id):
+    """
+    Fetches the latest TLE data for a satellite using its NORAD ID from Celestrak.
+
+    Parameters:
+        sat_id (int): NORAD ID of the satellite
+
+    Returns:
+        tuple: (name, line1, line2) if found, else (None, None, None)
+    """
+    try:
+        request_url = TLE_URL.format(sat_id=sat_id)
+        response = _SESSION.get(request_url)
+        response.raise_for_status()
+
+        # FORMAT=TLE returns the satellite name followed by the two TLE lines
+        tle_lines = [line.strip() for line in response.text.splitlines() if line.strip()]
+        if len(tle_lines) >= 3 and tle_lines[1].startswith('1 ') and tle_lines[2].startswith('2 '):
+            print(f"TLE lines for SAT_ID {sat_id}:\n{tle_lines[1]}\n{tle_lines[2]}")
+            return (str(sat_id), tle_lines[1], tle_lines[2])
+        print(f"No TLE data found for SAT_ID {sat_id}.")
+        return (None, None, None)
+
+    except Exception as e:
+        print(f"Error fetching TLE for satellite ID {sat_id}: {e}")
+        return (None, None, None)
+
+def fetch_tle_cached(sat_id):
+    """
+    Returns the TLE data for a satellite, reusing a recent on-disk copy when there is one.
+
+    Parameters:
+        sat_id (int): NORAD ID of the satellite
+
+    Returns:
+        tuple: (name, line1, line2) if found, else (None, None, None)
+    """
+    cache_path = Path(TLE_CACHE_DIR) / f"tle_{sat_id}.json"
+    try:
+        if time.time() - cache_path.stat().st_mtime < TLE_CACHE_TTL_SECONDS:
+            cached = json.loads(cache_path.read_text())
+            # Anything but [name, line1, line2] is treated like a corrupt file
+            if (isinstance(cached, list) and len(cached) == 3
+                    and all(isinstance(item, str) for item in cached)):
+                print(f"Using cached TLE for SAT_ID {sat_id}.")
+                return tuple(cached)
+    except (OSError, ValueError):
+        pass  # Missing or unreadable cache, fetch a fresh copy
+
+    name, line1, line2 = fetch_tle(sat_id)
+    if line1 and line2:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(json.dumps([name, line1, line2]))
+        except OSError as e:
+            print(f"Could not cache TLE for satellite ID {sat_id}: {e}")
+    return (name, line1, line2)
+
+def fetch_all_tles(sat_ids):
+    """
+    Fetches the TLE data for several satellites concurrently.
+
+    Parameters:
+        sat_ids (list): NORAD IDs of the satellites
+
+    Returns:
+        list: (name, line1, line2) tuples in the same order as sat_ids
+    """
+    if not sat_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=len(sat_ids)) as executor:
+        return list(executor.map(fetch_tle_cached, sat_ids))
+
+_TS = None
+
+def get_timescale():
+    """
+    Returns the shared Skyfield timescale, loading it on first use.
+
+    Returns:
+        Timescale: Skyfield timescale built from the bundled leap-second tables
+    """
+    global _TS
+    if _TS is None:
+        _TS = load.timescale(builtin=True)
+    return _TS
+
+def generate_time_steps(ts, start_time, days, step_minutes):
+    """
+    Generates a list of time steps for prediction.
+
+    Parameters:
+        ts (Timescale): Skyfield timescale used to build the Time objects
+        start_time (datetime): The starting UTC time
+        days (int): Number of days to predict
+        step_minutes (int): Interval between steps in minutes
+
+    Returns:
+        list: List of Skyfield Time objects
+    """
+    end_time = start_time + timedelta(days=days)
+    total_steps = int((days * 24 * 60) / step_minutes) + 1
+    # Integer minute offsets; Skyfield normalizes minute overflow into hours and days
+    minutes = start_time.minute + step_minutes * np.arange(total_steps, dtype=np.int64)
+    times = ts.utc(start_time.year, start_time.month, start_time.day,
+                   start_time.hour, minutes, start_time.second)
+    return times
+
+# ------------------------------ Data Collection ------------------------------
+
+# WGS84 ellipsoid, matching skyfield.api.wgs84
+WGS84_RADIUS_KM = 6378.137
+WGS84_FLATTENING = 1.0 / 298.257223563
+
+def itrs_to_geodetic(x, y, z):
+    """
+    Converts ITRS coordinates to WGS84 geodetic coordinates using Bowring's method.
+
+    Parameters:
+        x, y, z (np.ndarray): ITRS coordinates in kilometers
+
+    Returns:
+        tuple: (latitude in degrees, longitude in degrees, height in kilometers)
+    """
+    a = WGS84_RADIUS_KM
+    b = a * (1.0 - WGS84_FLATTENING)
+    e2 = WGS84_FLATTENING * (2.0 - WGS84_FLATTENING)
+    ep2 = e2 / (1.0 - e2)
+
+    p = np.hypot(x, y)
+    theta = np.arctan2(z * a, p * b)
+    lat = np.arctan2(z + ep2 * b * np.sin(theta) ** 3,
+                     p - e2 * a * np.cos(theta) ** 3)
+    lon = np.arctan2(y, x)
+    sin_lat = np.sin(lat)
+    height = p * np.cos(lat) + z * sin_lat - a * np.sqrt(1.0 - e2 * sin_lat * sin_lat)
+    return np.degrees(lat), np.degrees(lon), height
+
+def propagate_satellites(satellites, times):
+    """
+    Propagates all satellites over all time steps in a single SGP4 call.
+
+    Time steps where SGP4 reports an error, e.g. after a satellite has decayed,
+    are printed per satellite and come back as NaN.
+
+    Parameters:
+        satellites (list): List of sgp4 Satrec objects
+        times (list): Skyfield Time objects
+
+    Returns:
+        tuple: (latitude in degrees, longitude in degrees, altitude in km),
+               each an array of shape (satellites, times)
+    """
+    sat_array = SatrecArray(satellites)
+    # SGP4 expects UTC Julian dates. This copies the split done in
+    # skyfield.sgp4lib.EarthSatellite._position_and_velocity_TEME_km and relies
+    # on the private Time._leap_seconds(), so recheck it when moving off the
+    # skyfield==1.49 pinned in requirements.txt
+    jd = times.whole
+    fr = times.tai_fraction - times._leap_seconds() / DAY_S
+    errors, r_teme, v_teme = sat_array.sgp4(jd, fr)
+    for satellite, sat_errors in zip(satellites, errors):
+        failed = sat_errors[sat_errors != 0]
+        if failed.size:
+            reasons = '; '.join(SGP4_ERRORS[code] for code in np.unique(failed))
+            print(f"Warning: SGP4 failed for satellite {satellite.satnum} at {failed.size} of "
+                  f"{sat_errors.size} time steps ({reasons}); those positions are skipped.")
+    # SGP4 still returns a position for some errors (a decayed satellite ends up
+    # underground), so blank every failed step instead of plotting it
+    r_teme[errors != 0] = np.nan
+    # One TEME -> ITRS rotation per time step, applied to every satellite at once
+    rotation = mxm(itrs.rotation_at(times), TEME.rotation_at(times).swapaxes(0, 1))
+    # (satellites, times, xyz) -> (xyz, satellites, times)
+    x, y, z = mxv(rotation, np.moveaxis(r_teme, -1, 0))
+    return itrs_to_geodetic(x, y, z)
+
+# Column layout of the coordinates array returned by collect_satellite_data
+COL_LAT, COL_LON, COL_ALT_KM, COL_ELEV_M = range(4)
+
+def collect_satellite_data(satellites, times):
+    """
+    Computes the geocentric positions of satellites over specified times.
+
+    Parameters:
+        satellites (list): List of sgp4 Satrec objects
+        times (list): Skyfield Time objects
+
+    Returns:
+        np.ndarray: float32 coordinates array of shape (satellites, times, 4) with
+                    columns COL_LAT, COL_LON, COL_ALT_KM, COL_ELEV_M, in the order
+                    of satellites
+    """
+    latitudes, longitudes, altitudes_km = propagate_satellites(satellites, times)
+    # float32 is far finer than a map pixel and halves the memory moved while plotting
+    coords = np.empty(latitudes.shape + (4,), dtype=np.float32)
+    coords[:, :, COL_LAT] = latitudes
+    coords[:, :, COL_LON] = longitudes
+    coords[:, :, COL_ALT_KM] = altitudes_km
+    coords[:, :, COL_ELEV_M] = altitudes_km * 1000.0
+    return coords
+
+# ------------------------------ Visualization ------------------------------
+
+def is_interactive_backend():
+    """
+    Tells whether the active matplotlib backend can open figure windows.
+
+    Returns:
+        bool: True for GUI backends such as TkAgg or QtAgg, False for Agg, pdf, svg and the like
+    """
+    interactive = backend_registry.list_builtin(BackendFilter.INTERACTIVE)
+    return matplotlib.get_backend().lower() in interactive
+
+@functools.lru_cache(maxsize=None)
+def _map_features(resolution):
+    """
+    Builds the Natural Earth features drawn on every map, once per resolution.
+
+    Parameters:
+        resolution (str or Scaler): Natural Earth scale, e.g. '110m', or a cartopy
+                                    Scaler that picks one from the map extent
+
+    Returns:
+        tuple: (feature, add_feature keyword arguments) pairs
+    """
+    land = cfeature.NaturalEarthFeature('physical', 'land', resolution,
+                                        edgecolor='face', facecolor=cfeature.COLORS['land'])
+    borders = cfeature.NaturalEarthFeature('cultural', 'admin_0_boundary_lines_land', resolution,
+                                           edgecolor='black', facecolor='none')
+    coastline = cfeature.NaturalEarthFeature('physical', 'coastline', resolution,
+                                             edgecolor='black', facecolor='none')
+    lakes = cfeature.NaturalEarthFeature('physical', 'lakes', resolution,
+                                         edgecolor='face', facecolor=cfeature.COLORS['water'])
+    return (
+        (land, {}),
+        (borders, {'linestyle': ':'}),
+        (coastline, {}),
+        (lakes, {'alpha': 0.5}),
+    )
+
+def add_map_features(ax, resolution=cfeature.auto_scaler):
+    """
+    Draws the base map, using the axes background as ocean instead of the OCEAN feature.
+
+    Parameters:
+        ax (GeoAxes): Axes to draw on
+        resolution (str or Scaler): Natural Earth scale; by default the same
+                                    extent-based choice as cfeature.LAND and friends
+    """
+    ax.set_facecolor(cfeature.COLORS['water'])
+    for feature, kwargs in _map_features(resolution):
+        ax.add_feature(feature, **kwargs)
@@ -1,238 +1,209 @@
-import requests
-from skyfield.api import EarthSatellite, load, wgs84
+from sgp4.api import Satrec, accelerated
+import matplotlib
+import os
+import sys
+# Only direct runs pick a backend; importers keep their own. DISPLAY only
+# signals a missing screen on Linux, macOS and Windows never set it.
+if (__name__ == "__main__" and sys.platform.startswith('linux')
+        and not os.environ.get('DISPLAY')):
+    matplotlib.use('Agg')  # Headless run: never set up a GUI backend
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import numpy as np
-from datetime import datetime, timedelta
-from matplotlib.colors import Normalize
+from datetime import datetime
+from matplotlib.colors import Normalize, to_rgb
 import matplotlib.cm as cm
 
 from config import *
-
-
-# ------------------------------ Helper Functions ------------------------------
-
-def fetch_tle(sat_id):
-    """
-    Fetches the latest TLE data for a satellite using its NORAD ID from N2YO.
-
-    Parameters:
-        sat_id (int): NORAD ID of the satellite
-
-    Returns:
-        tuple: (name, line1, line2) if found, else (None, None, None)
-    """
-    try:
-        request_url = TLE_URL.format(sat_id=sat_id, api_key=API_KEY)
-        response = requests.get(request_url)
-        response.raise_for_status()
-        data = response.json()
-
-        if 'tle' in data and data['tle']:
-            tle_lines = data["tle"].splitlines()
-            if len(tle_lines) >= 2:
-                print(f"TLE lines for SAT_ID {sat_id}:\n{tle_lines[0]}\n{tle_lines[1]}")
-                return (str(sat_id), tle_lines[0], tle_lines[1])
-            else:
-                print(f"Incomplete TLE data for SAT_ID {sat_id}.")
-        else:
-            print(f"No TLE data found for SAT_ID {sat_id}.")
-        return (None, None, None)
-
-    except Exception as e:
-        print(f"Error fetching TLE for satellite ID {sat_id}: {e}")
-        return (None, None, None)
-
-def generate_time_steps(start_time, days, step_minutes):
-    """
-    Generates a list of time steps for prediction.
-
-    Parameters:
-        start_time (datetime): The starting UTC time
-        days (int): Number of days to predict
-        step_minutes (int): Interval between steps in minutes
-
-    Returns:
-        tuple: (Skyfield Time objects, corresponding datetime objects)
-    """
-    ts = load.timescale()
-    end_time = start_time + timedelta(days=days)
-    total_steps = int((days * 24 * 60) / step_minutes) + 1
-    # Generate array of minutes to add
-    minutes_array = step_minutes * np.arange(total_steps)
-    # Calculate the corresponding datetime objects
-    times_datetime = [start_time + timedelta(minutes=int(m)) for m in minutes_array]
-    # Convert to Skyfield Time objects
-    times = ts.utc([dt.year for dt in times_datetime],
-                  [dt.month for dt in times_datetime],
-                  [dt.day for dt in times_datetime],
-                  [dt.hour for dt in times_datetime],
-                  [dt.minute for dt in times_datetime],
-                  [dt.second for dt in times_datetime])
-    return times, times_datetime  # Return both Skyfield and datetime objects
+from satellite_utils import (
+    COL_ALT_KM, COL_LAT, COL_LON, add_map_features, collect_satellite_data,
+    fetch_all_tles, generate_time_steps, get_timescale, is_interactive_backend,
+)
 
 # ------------------------------ Data Collection ------------------------------
 
-def collect_satellite_data(satellites, times, times_datetime, filter_altitude=False):
+def filter_satellite_data(names, coords, max_altitude_km):
     """
-    Computes the geocentric positions of satellites over specified times
-    and optionally filters out positions with altitude_km > MAX_ALTITUDE_KM.
+    Keeps only the positions with altitude_km <= max_altitude_km.
+
+    Positions above the limit are set to NaN so every satellite keeps the
+    shared time axis; satellites with no remaining positions are dropped.
 
     Parameters:
-        satellites (list): List of EarthSatellite objects
-        times (list): Skyfield Time objects
-        times_datetime (list): Corresponding list of datetime objects
-        filter_altitude (bool): Whether to filter positions with altitude_km > MAX_ALTITUDE_KM
+        names (list): Satellite names, in the order of the coords rows
+        coords (np.ndarray): Coordinates array as returned by collect_satellite_data
+        max_altitude_km (float): Maximum altitude in kilometers
 
     Returns:
-        dict: Dictionary containing positions for each satellite
+        tuple: (names of the kept satellites, their filtered coordinates array)
     """
-    data = {}
-    for sat in satellites:
-        geocentric = sat.at(times)
-        subpoint = geocentric.subpoint()
-        lat = subpoint.latitude.degrees
-        lon = subpoint.longitude.degrees
-        alt_km = subpoint.elevation.km
-
-        if filter_altitude:
-            # Create a mask for altitudes <= MAX_ALTITUDE_KM
-            mask = alt_km <= MAX_ALTITUDE_KM
-            if np.any(mask):
-                filtered_times = [times_datetime[i] for i, m in enumerate(mask) if m]
-                data[sat.name] = {
-                    'latitude': lat[mask],
-                    'longitude': lon[mask],
-                    'elevation_m': subpoint.elevation.m[mask],
-                    'altitude_km': alt_km[mask],
-                    'times': filtered_times
-                }
-                print(f"Satellite {sat.name}: {np.sum(mask)} points below {MAX_ALTITUDE_KM} km.")
-            else:
-                print(f"Satellite {sat.name} has no points below {MAX_ALTITUDE_KM} km.")
+    # One mask for all satellites and time steps
+    mask = coords[:, :, COL_ALT_KM] <= max_altitude_km
+    counts = mask.sum(axis=1)
+    for name, count in zip(names, counts):
+        if count:
+            print(f"Satellite {name}: {count} points below {max_altitude_km} km.")
         else:
-            # No filtering
-            data[sat.name] = {
-                'latitude': lat,
-                'longitude': lon,
-                'elevation_m': subpoint.elevation.m,
-                'altitude_km': alt_km,
-                'times': times_datetime  # All times
-            }
-            print(f"Satellite {sat.name}: {len(lat)} total points collected.")
-    return data
+            print(f"Satellite {name} has no points below {max_altitude_km} km.")
+
+    keep = counts > 0
+    filtered = np.where(mask[:, :, np.newaxis], coords, np.nan)[keep]
+    return [name for name, kept in zip(names, keep) if kept], filtered
 
 # ------------------------------ Visualization ------------------------------
 
-def plot_filtered_orbits(filtered_data, map_extent, center_lat, center_lon):
+# Shared map projection, so both plots reuse the same CRS and its cached transforms
+_PC = ccrs.PlateCarree()
+
+def plot_filtered_orbits(coords, map_extent, center_lat, center_lon):
     """
     Plots filtered satellite paths on a map, color-coded based on altitude.
 
     Parameters:
-        filtered_data (dict): Filtered satellite data with latitudes, longitudes, and altitudes
+        coords (np.ndarray): Filtered coordinates array, NaN where filtered out
         map_extent (list): [West, East, South, North] in degrees
         center_lat (float): Center latitude for the map
         center_lon (float): Center longitude for the map
+
+    Returns:
+        Figure: The saved figure, left open for the caller to show or close
     """
-    plt.figure(figsize=(15, 10))
-    ax = plt.axes(projection=ccrs.PlateCarree())
-    ax.set_extent(map_extent, crs=ccrs.PlateCarree())
+    fig = plt.figure(figsize=(15, 10))
+    ax = plt.axes(projection=_PC)
+    ax.set_extent(map_extent, crs=_PC)
 
     # Map features
-    ax.add_feature(cfeature.LAND)
-    ax.add_feature(cfeature.OCEAN)
-    ax.add_feature(cfeature.BORDERS, linestyle=':')
-    ax.add_feature(cfeature.COASTLINE)
-    ax.add_feature(cfeature.LAKES, alpha=0.5)
-    ax.add_feature(cfeature.RIVERS)
+    add_map_features(ax)
 
     # Observer location
     ax.plot(OBSERVER_LON, OBSERVER_LAT, marker='^', color='red', markersize=12,
-             transform=ccrs.PlateCarree(), label='Observer')
+             transform=_PC, label='Observer')
 
     # Prepare colormap
     cmap = cm.viridis
     norm = Normalize(vmin=0, vmax=MAX_ALTITUDE_KM)
 
-    # Plot each satellite's data
-    for sat_name, sat_data in filtered_data.items():
-        latitudes = sat_data['latitude']
-        longitudes = sat_data['longitude']
-        alts = sat_data['altitude_km']
+    # Plot all satellites' points as one collection with colors mapped up front;
+    # the colorbar, not the legend, explains them
+    valid = np.isfinite(coords[:, :, COL_ALT_KM])
+    latitudes = coords[:, :, COL_LAT][valid]
+    longitudes = coords[:, :, COL_LON][valid]
+    rgba = cmap(norm(coords[:, :, COL_ALT_KM][valid]))
 
-        scatter = ax.scatter(longitudes, latitudes, c=alts, cmap=cmap, norm=norm,
-                             s=10, alpha=0.7, transform=ccrs.PlateCarree(), label=sat_name)
+    ax.scatter(longitudes, latitudes, c=rgba, s=10, alpha=0.7, edgecolors='none',
+               rasterized=True, transform=_PC)
 
     # Add colorbar
-    cbar = plt.colorbar(scatter, ax=ax, orientation='vertical', pad=0.02, shrink=0.7)
+    mappable = cm.ScalarMappable(norm=norm, cmap=cmap)
+    cbar = plt.colorbar(mappable, ax=ax, orientation='vertical', pad=0.02, shrink=0.7)
     cbar.set_label('Altitude (km)', fontsize=12)
 
     plt.title(f'Legion Satellites Orbits - Next {PREDICTION_DAYS} Days\n'
               f'Filtered to Altitudes ≤ {MAX_ALTITUDE_KM} km', fontsize=14)
     plt.legend(loc='upper right')
     plt.savefig(OUTPUT_IMAGE_FILTERED, dpi=300, bbox_inches='tight')
-    plt.show()
+    return fig
 
-def plot_all_orbits(all_data, map_extent, center_lat, center_lon):
+def rasterize_orbits(coords, map_extent, colors, width=450, height=300):
+    """
+    Aggregates satellite points onto a fixed raster covering the map extent.
+
+    Each pixel is colored by the mix of satellites that passed through it,
+    so drawing cost no longer grows with the number of points. The default
+    size makes one pixel roughly as wide as the old 5pt² scatter markers.
+
+    Parameters:
+        coords (np.ndarray): Coordinates array of shape (satellites, times, 4)
+        map_extent (list): [West, East, South, North] in degrees
+        colors (list): One matplotlib color per satellite
+        width (int): Raster width in pixels
+        height (int): Raster height in pixels
+
+    Returns:
+        np.ndarray: RGBA image of shape (height, width, 4), first row at the southern edge
+    """
+    value_range = [[map_extent[2], map_extent[3]], [map_extent[0], map_extent[1]]]
+    rgb_sum = np.zeros((height, width, 3))
+    total = np.zeros((height, width))
+    for sat_coords, color in zip(coords, colors):
+        counts, _, _ = np.histogram2d(sat_coords[:, COL_LAT], sat_coords[:, COL_LON],
+                                      bins=(height, width), range=value_range)
+        rgb_sum += counts[..., np.newaxis] * to_rgb(color)
+        total += counts
+
+    image = np.zeros((height, width, 4))
+    hit = total > 0
+    image[hit, :3] = rgb_sum[hit] / total[hit, np.newaxis]
+    image[hit, 3] = 1.0
+    return image
+
+def plot_all_orbits(names, coords, map_extent, center_lat, center_lon):
     """
     Plots all satellite trajectories on a map without altitude filtering.
 
     Parameters:
-        all_data (dict): All satellite data with latitudes and longitudes
+        names (list): Satellite names
+        coords (np.ndarray): Coordinates array of shape (satellites, times, 4)
         map_extent (list): [West, East, South, North] in degrees
         center_lat (float): Center latitude for the map
         center_lon (float): Center longitude for the map
+
+    Returns:
+        Figure: The saved figure, left open for the caller to show or close
     """
-    plt.figure(figsize=(15, 10))
-    ax = plt.axes(projection=ccrs.PlateCarree())
-    ax.set_extent(map_extent, crs=ccrs.PlateCarree())
+    fig = plt.figure(figsize=(15, 10))
+    ax = plt.axes(projection=_PC)
+    ax.set_extent(map_extent, crs=_PC)
 
     # Map features
-    ax.add_feature(cfeature.LAND)
-    ax.add_feature(cfeature.OCEAN)
-    ax.add_feature(cfeature.BORDERS, linestyle=':')
-    ax.add_feature(cfeature.COASTLINE)
-    ax.add_feature(cfeature.LAKES, alpha=0.5)
-    ax.add_feature(cfeature.RIVERS)
+    add_map_features(ax)
 
     # Observer location
     ax.plot(OBSERVER_LON, OBSERVER_LAT, marker='^', color='red', markersize=12,
-             transform=ccrs.PlateCarree(), label='Observer')
+             transform=_PC, label='Observer')
 
-    # Plot each satellite's trajectory
-    for sat_name, sat_data in all_data.items():
-        latitudes = sat_data['latitude']
-        longitudes = sat_data['longitude']
+    # Draw all trajectories as one aggregated raster
+    cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    colors = [cycle[idx % len(cycle)] for idx in range(len(names))]
+    image = rasterize_orbits(coords, map_extent, colors)
+    ax.imshow(image, origin='lower', extent=map_extent, interpolation='nearest',
+              transform=_PC)
 
-        ax.plot(longitudes, latitudes, label=sat_name, alpha=0.5)
-        ax.scatter(longitudes, latitudes, s=5, color='blue', alpha=0.3)
+    # Empty lines only provide the legend entries
+    for sat_name, color in zip(names, colors):
+        ax.plot([], [], color=color, marker='o', linestyle='none', label=sat_name)
 
     plt.title(f'Legion Satellites Orbits - Next {PREDICTION_DAYS} Days\n'
               f'All Altitudes', fontsize=14)
     plt.legend(loc='upper right')
-    plt.savefig(OUTPUT_IMAGE_ALL, dpi=300, bbox_inches='tight')
-    plt.show()
+    # The map is mostly empty raster; 150 dpi without a tight-bbox pass is plenty
+    plt.savefig(OUTPUT_IMAGE_ALL, dpi=150, bbox_inches=None)
+    return fig
 
 # ------------------------------ Main Execution ------------------------------
 
 def main():
-    ts = load.timescale()
+    # Ask the active backend rather than DISPLAY, which macOS and Windows never set
+    interactive = is_interactive_backend()
+    if not accelerated:
+        print("Warning: the sgp4 C extension is not available, propagation will run in pure Python.")
+
+    ts = get_timescale()
 
     start_time = datetime.utcnow()
 
     # Generate time steps
     print(f"Generating time steps from {start_time} for next {PREDICTION_DAYS} days...")
-    times, times_datetime = generate_time_steps(start_time, PREDICTION_DAYS, TIME_STEP_MINUTES)
+    times = generate_time_steps(ts, start_time, PREDICTION_DAYS, TIME_STEP_MINUTES)
 
-    # Fetch TLEs and create EarthSatellite objects
+    # Fetch TLEs and parse them straight into sgp4 Satrec objects
+    names = []
     satellites = []
     print("Fetching TLE data...")
-    for sat_id in SATELLITE_IDS:
-        name, line1, line2 = fetch_tle(sat_id)
+    for sat_id, (name, line1, line2) in zip(SATELLITE_IDS, fetch_all_tles(SATELLITE_IDS)):
         if line1 and line2:
-            sat = EarthSatellite(line1, line2, name, ts)
-            satellites.append(sat)
+            names.append(name)
+            satellites.append(Satrec.twoline2rv(line1, line2))
             print(f"Fetched TLE for {name} (NORAD ID: {sat_id})")
         else:
             print(f"Skipping satellite ID {sat_id} due to missing TLE.")
@@ -241,30 +212,39 @@ def main():
         print("No satellites to track. Exiting.")
         return
 
-    # Collect satellite data with filtering
-    print("Computing and filtering satellite positions...")
-    filtered_satellite_data = collect_satellite_data(satellites, times, times_datetime, filter_altitude=True)
+    # Collect all satellite data once
+    print("Computing satellite positions...")
+    coords = collect_satellite_data(satellites, times)
+    for name in names:
+        print(f"Satellite {name}: {coords.shape[1]} total points collected.")
 
-    # Collect all satellite data without filtering
-    print("Collecting all satellite positions without filtering...")
-    all_satellite_data = collect_satellite_data(satellites, times, times_datetime, filter_altitude=False)
+    # Derive the filtered data from the same positions
+    print("Filtering satellite positions...")
+    filtered_names, filtered_coords = filter_satellite_data(names, coords, MAX_ALTITUDE_KM)
 
-    if not filtered_satellite_data:
+    if not filtered_names:
         print(f"No satellite positions found below {MAX_ALTITUDE_KM} km.")
 
     # Plot filtered satellite orbits
-    if filtered_satellite_data:
+    if filtered_names:
         print("Plotting filtered satellite orbits...")
-        plot_filtered_orbits(filtered_satellite_data, MAP_EXTENT, CENTER_LAT, CENTER_LON)
+        fig = plot_filtered_orbits(filtered_coords, MAP_EXTENT, CENTER_LAT, CENTER_LON)
         print(f"Filtered visualization saved as '{OUTPUT_IMAGE_FILTERED}'.")
+        if not interactive:
+            plt.close(fig)  # Free the figure before the next plot is built
     else:
         print("No filtered data to plot.")
 
     # Plot all satellite orbits
     print("Plotting all satellite orbits...")
-    plot_all_orbits(all_satellite_data, MAP_EXTENT, CENTER_LAT, CENTER_LON)
+    fig = plot_all_orbits(names, coords, MAP_EXTENT, CENTER_LAT, CENTER_LON)
     print(f"All orbits visualization saved as '{OUTPUT_IMAGE_ALL}'.")
 
+    # Show every figure together once, instead of blocking after each plot
+    if interactive:
+        plt.show()
+    plt.close('all')
+
 if __name__ == "__main__":
     main()
 